@@ -1,8 +1,14 @@
-import machine, time, random, gc
+import machine, time, random, gc, os
 from machine import Pin, SPI
+from micropython import const
 import st7789_base
 import st7789_ext
+import scheduler
 import dht
+try:
+    import _thread, ringbuf
+except ImportError:
+    _thread = None # No threads support, for instance on the ESP8266.
 
 ################################ CONFIGURATION #################################
 
@@ -21,6 +27,23 @@ sampling_period = 15 # Read temperature/humidity every N seconds.
 daily_sampling_period = 9 # Store a daily sample every M minutes. With
                           # 9 minutes the 160 pixels of the display will
                           # cover exactly 24 hours.
+
+low_power = False # Put the MCU in light sleep between samples to save
+                  # power. Note that while sleeping the USB serial / REPL
+                  # may not respond.
+
+display_on_time = 0 # Turn off the display and its backlight after N
+                    # seconds from the last refresh. It is turned on
+                    # again when the readings change. 0 = always on.
+
+use_threads = True # Where threads are available (ESP32, unix port), read the
+                   # sensor in a separate thread, so that slow screen
+                   # updates never delay or drop a reading.
+
+bundle_file = "images.bundle" # Background images packed in a single file,
+                              # created with tools/mkbundle.py. If missing,
+                              # single .565 files are used instead.
+
 # We take temp readings of the last hour in high resolution, and
 # historical data of the last couple of days with hourly resolution.
 # In both cases, we only take the latest 'display.width' samples as
@@ -50,6 +73,7 @@ dht = dht.DHT22(Pin(16))
 display.init(landscape=True,mirror_y=True)
 backlight = Pin(5,Pin.OUT)
 backlight.on()
+display_on = True
 
 # Colors hand picked to be kinda credible in my cheap TFT display,
 # in the hope that the gamma is broken in similar ways.
@@ -79,15 +103,31 @@ bg_color = c64colors['blue']         # Screen background
 fg_color = c64colors['light_blue']         # Screen border
 graph_color1 = c64colors['violet'] # Temp graph 1
 graph_color2 = c64colors['orange'] # Temp graph 2
+bar_color = display.color(10,10,10)     # Graph bars
+dither_color = display.color(30,30,30)  # Graph bars dithering
+shadow_color = display.color(5,5,5)     # Graph title shadow
 
-# Finally make a list of images available
+# Finally make a list of images available. If there is a bundle with
+# all the images packed together (see tools/mkbundle.py) we use it,
+# otherwise we look for single .565 files in the flash.
 bg_images = []
-for filename in os.listdir():
-    if filename[-3:] == '565':
-        bg_images.append(filename)
-        # display.image(0,0,filename)
+try:
+    bg_bundle = st7789_ext.ImageBundle(bundle_file)
+    bg_images = bg_bundle.names()
+except (OSError, ValueError):
+    bg_bundle = None
+    for filename in os.listdir():
+        if filename[-3:] == '565':
+            bg_images.append(filename)
+            # display.image(0,0,filename)
 print("Found background images: ",bg_images)
 
+def show_bg_image(name):
+    if bg_bundle:
+        display.bundle_image(0,0,bg_bundle,name)
+    else:
+        display.image(0,0,name)
+
 def show_palette():
     j = 0
     for colorname in ['black','white','red','cyan','violet','green','blue','yellow','orange','brown','light_red','grey1','grey2','light_green','light_blue','grey3']:
@@ -184,7 +224,7 @@ def main_view(title,temp,humidity,ts,color):
 
     # Show the background image.
     r = random.getrandbits(8) ^ (random.getrandbits(8)>>3)
-    display.image(0,0,bg_images[r%len(bg_images)])
+    show_bg_image(bg_images[r%len(bg_images)])
 
     upscaling = 2
     header_height = (16+8+5) # header text + padding
@@ -247,17 +287,17 @@ def main_view(title,temp,humidity,ts,color):
         graph_style = 'dithered'
         if graph_style == 'solid':
             for i in range(len(ts)):
-                display.vline(ybase,bar_heights[i]+1,i,display.color(10,10,10))
+                display.vline(ybase,bar_heights[i]+1,i,bar_color)
         elif graph_style == 'alternating':
             for i in range(len(ts)):
                 if i % 3 != 0:
-                    display.vline(ybase,bar_heights[i]+1,i,display.color(0,0,0))
+                    display.vline(ybase,bar_heights[i]+1,i,c64colors['black'])
         elif graph_style == 'dithered':
             for i in range(len(ts)):
-                display.vline(ybase,bar_heights[i]+1,i,display.color(10,10,10))
+                display.vline(ybase,bar_heights[i]+1,i,bar_color)
                 if i % 4 == 0:
                     for y in range(bar_heights[i]+(i%3*2),ybase,4):
-                        display.pixel(i,y,display.color(30,30,30))
+                        display.pixel(i,y,dither_color)
 
         # Draw a continuous line connecting the time series data points.
         for i in range(0,len(ts)-1):
@@ -275,7 +315,7 @@ def main_view(title,temp,humidity,ts,color):
                           display.width,int(display.height*0.33),
                           title,c64colors['grey3'],1,
                           x_align=ALIGN_MID,y_align=ALIGN_MID,
-                          shadow=display.color(5,5,5))
+                          shadow=shadow_color)
 
 # This is an helper function for save_state(). To save the array
 # of values on disk, we can't just use repr(), because it will use
@@ -312,77 +352,174 @@ def load_state():
         print("Loading settings: "+str(e))
         pass # Corrupted data?
 
+# Turn the display panel and its backlight on or off.
+def set_display_power(on):
+    global display_on
+    if on == display_on: return
+    if on:
+        display.sleep_mode(False)
+        time.sleep_ms(120) # The panel needs some time after sleep out.
+        backlight.on()
+    else:
+        backlight.off()
+        display.sleep_mode(True)
+    display_on = on
+
 # Creates a unique fingerprint of the current readings, to update
 # the view only if sensor data changes. Our readings are so easy
 # that is more memory efficient to just contatenate the strings.
 def hash_sensor_data(*args):
     return "_".join([str(x) for x in args])
 
+# Sensor sampling state.
+sample_count = 0        # Number of successful sensor readings.
+last_two_readings = []  # We average last two readings for the
+                        # hourly time series, so each sample represents
+                        # 10 seconds.
+
+# Read the sensor and update the time series, returning temperature and
+# humidity. Raises an exception if the sensor times out.
+# Note that the time series lists are never modified in place, but
+# replaced by new lists: this way the render thread can keep using the
+# lists it received without locking.
+def take_sample():
+    global ts_h, ts_d, sample_count, last_two_readings
+    dht.measure()
+    temp,humidity = dht.temperature(),dht.humidity()
+    sample_count += 1
+    last_two_readings.append(temp)
+
+    if len(last_two_readings) == 2:
+        ts_h = ts_h[-(display.width-1):]+[sum(last_two_readings)/2]
+        last_two_readings = [] # Start collecting two readings again.
+    if sample_count % spq == 0 and len(ts_h) >= spq//2:
+        # Every N minutes we populate the last days time series.
+        ts_d = ts_d[-(display.width-1):]+[sum(ts_h[-(spq//2):])/(spq//2)]
+    print("T, H, freemem:",temp,humidity,gc.mem_free())
+
+    # Only useful for debugging of data collection.
+    if False:
+        print("ts_h",ts_h)
+        print("ts_d",ts_d)
+    return temp,humidity
+
+# Rendering state.
+data_hash = None    # Hashing of last data rendered. As long as both
+                    # temperature and humidity are the same we don't
+                    # refresh them.
+daily_graph = False # Used to alternate between hourly and daily graph.
+render_count = 0    # Number of render_view() calls.
+last_render = 0     # Time of the last view update, in ticks_ms.
+
+# Update the display with the provided readings and time series, if
+# needed, and turn the display off when it's time to.
+def render_view(temp,humidity,hourly,daily):
+    global data_hash, daily_graph, render_count, last_render
+    cur_hash = hash_sensor_data(temp,humidity)
+    render_count += 1
+
+    # From time to time show again the loading screen. Not when the
+    # display is off: we don't want to wake it up just for this.
+    if display_on and render_count > 1 and random.getrandbits(5) == 0:
+        c64_screen(show_banner=True,type_text=["LOAD *,8,1","RUN"])
+        data_hash = None # Force refresh of view
+
+    # Display current view. If readings didn't change the view
+    # would be the same, so we skip rendering it.
+    if cur_hash != data_hash:
+        set_display_power(True)
+        if daily_graph:
+            main_view("daily",temp,humidity,daily,graph_color2)
+        else:
+            main_view(f"{int(display.width*sampling_period*2/60)} minutes",temp,humidity,hourly,graph_color1)
+        data_hash = cur_hash
+        daily_graph = not daily_graph
+        last_render = time.ticks_ms()
+
+    if display_on_time and \
+       time.ticks_diff(time.ticks_ms(),last_render) >= display_on_time*1000:
+        set_display_power(False)
+
+# Sampler thread: owns the sensor timing and publishes every reading,
+# together with the time series, into the 'readings' ring buffer.
+def sampler_thread(readings):
+    # Light sleep stops the render thread too, so we use it only when
+    # the render thread is just waiting for new readings. Otherwise we
+    # sleep in small steps, so that once the rendering is done we can
+    # switch to light sleep (the scheduler keeps sleeping till the
+    # deadline if we return early).
+    def sleep(ms):
+        if low_power and readings.waiting:
+            machine.lightsleep(ms)
+        else:
+            time.sleep_ms(min(ms,500))
+
+    # While the render thread is drawing the device is not idle, even
+    # if this thread is sleeping: account that time as active.
+    sched = scheduler.Scheduler(sampling_period*1000,sleep=sleep,
+        busy=lambda: not readings.waiting)
+    while True:
+        # Sometimes DHT11/22 sensors randomly timeout.
+        try:
+            temp,humidity = take_sample()
+        except:
+            print("Sensor reading failed: check cables and pin configuration")
+            sched.idle(1000)
+            continue
+        readings.push((temp,humidity,ts_h,ts_d))
+        print("Power:",sched.report())
+        # If this thread dies the display would show the last reading
+        # forever without any error, so errors saving (for instance
+        # because the flash is full) are just logged.
+        if sample_count % 10 == 0 and save_history:
+            try:
+                save_state()
+            except Exception as e:
+                print("Saving history: "+str(e))
+
+        # Sleep till the next sensor reading is due.
+        sched.wait()
+
+# Used when threads are available: sampling happens in its own thread,
+# while this one just renders the most recent reading.
+def main_threaded():
+    readings = ringbuf.RingBuffer(8)
+    _thread.start_new_thread(sampler_thread,(readings,))
+    while True:
+        pending = readings.wait()
+        render_view(*pending[-1])
+        gc.collect()
+
 def main():
-    global ts_h, ts_d
-    data_hash = None    # Hashing of last data rendered. As long as both
-                        # temperature and humidity are the same we don't
-                        # refresh them.
-    daily_graph = False # Used to alternate between hourly and daily graph.
+    global last_render
     # Let's start the show.
     c64_screen(show_banner=True,type_text=["LOAD *,8,1","RUN"])
-    loop_count = 1
+    last_render = time.ticks_ms()
     load_state()        # Load past data
 
-    last_two_readings = [] # We average last two readings for the
-                           # hourly time series, so each sample represents
-                           # 10 seconds.
-    while True:
-        loop_start = time.ticks_ms()
+    if use_threads and _thread:
+        return main_threaded()
 
+    sched = scheduler.Scheduler(sampling_period*1000,
+        sleep=machine.lightsleep if low_power else None)
+    while True:
         # Sometimes DHT11/22 sensors randomly timeout.
         try:
-            dht.measure()
+            temp,humidity = take_sample()
         except:
             print("Sensor reading failed: check cables and pin configuration")
-            time.sleep(1)
+            sched.idle(1000)
             continue
-
-        # Print / store the data
-        cur_hash = hash_sensor_data(dht.temperature(),dht.humidity())
-        last_two_readings.append(dht.temperature())
-
-        if len(last_two_readings) == 2:
-            ts_h.append(sum(last_two_readings)/2)
-            ts_h = ts_h[-display.width:]
-            last_two_readings = [] # Start collecting two readings again.
-        if loop_count % spq == 0 and len(ts_h) >= spq//2:
-            # Every N minutes we populate the last days time series.
-            ts_d.append(sum(ts_h[-(spq//2):])/(spq//2))
-            ts_d = ts_d[-display.width:]
-        print("T, H, freemem:",dht.temperature(),dht.humidity(),gc.mem_free())
-
-        # Only useful for debugging of data collection.
-        if False:
-            print("ts_h",ts_h)
-            print("ts_d",ts_d)
-
-        # From time to time show again the loading screen.
-        if loop_count > 1 and random.getrandbits(5) == 0:
-            c64_screen(show_banner=True,type_text=["LOAD *,8,1","RUN"])
-            data_hash = None # Force refresh of view
-
-        # Display current view
-        if cur_hash != data_hash:
-            if daily_graph:
-                main_view("daily",dht.temperature(),dht.humidity(),ts_d,graph_color2)
-            else:
-                main_view(f"{int(display.width*sampling_period*2/60)} minutes",dht.temperature(),dht.humidity(),ts_h,graph_color1)
-            data_hash = cur_hash
-            daily_graph = not daily_graph
-
-        # Wait 10 seconds from the last sensor reading.
-        while time.ticks_diff(time.ticks_ms(),loop_start) < sampling_period*1000:
-            time.sleep_ms(100)
-
-        loop_count += 1
+        print("Power:",sched.report())
+        render_view(temp,humidity,ts_h,ts_d)
         gc.collect()
-        if loop_count % 10 == 0 and save_history: save_state()
+        if sample_count % 10 == 0 and save_history: save_state()
+
+        # Sleep till the next sensor reading is due. All the work is
+        # done at this point, so the next reading starts on time.
+        sched.wait()
 
-# Entry point.
-main()
+# Entry point. The check allows to import this file without running
+# the thermometer, as tools/bench.py does.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Fixed size ring buffer protected by a lock, used to pass sensor
+# readings from the sampler thread to the render thread.
+#
+# Copyright (C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# All Rights Reserved
+# This code is released under the MIT license.
+
+import _thread
+
+class RingBuffer:
+    def __init__(self,size):
+        self.items = [None]*size
+        self.head = 0   # Index where the next item will be stored.
+        self.unread = 0 # Items pushed and not yet drained.
+        self.lock = _thread.allocate_lock()
+        # The 'ready' lock is held while there is nothing to read, so
+        # that the consumer can block on it in wait().
+        self.ready = _thread.allocate_lock()
+        self.ready.acquire()
+        self.waiting = False # True while the consumer is blocked in wait().
+
+    # Add an item. When the buffer is full the oldest item
+    # is overwritten, so the producer never blocks waiting
+    # for a slow consumer.
+    def push(self,item):
+        with self.lock:
+            self.items[self.head] = item
+            self.head = (self.head+1) % len(self.items)
+            self.unread = min(self.unread+1,len(self.items))
+            if self.ready.locked(): self.ready.release()
+
+    # Return the list of items pushed since the last call,
+    # from the oldest to the newest. Empty list if there are none.
+    def drain(self):
+        with self.lock:
+            size = len(self.items)
+            start = self.head-self.unread
+            res = [self.items[(start+i) % size] for i in range(self.unread)]
+            self.unread = 0
+        return res
+
+    # Like drain(), but blocks until at least one item is available.
+    def wait(self):
+        while True:
+            self.waiting = True
+            self.ready.acquire()
+            self.waiting = False
+            # The lock may have been released by a push whose item we
+            # already drained: in that case just wait again.
+            res = self.drain()
+            if res: return res
@@ -0,0 +1,67 @@
+# Power aware scheduling of the thermometer main loop.
+#
+# Copyright (C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# All Rights Reserved
+# This code is released under the MIT license.
+
+import time
+
+# The scheduler sleeps until the next sample is due, and accounts the
+# time spent doing work (active) and sleeping (idle).
+#
+# 'period' is the sampling period in milliseconds. 'clock' is any object
+# providing ticks_ms(), ticks_diff(), ticks_add() and sleep_ms() like the
+# MicroPython time module: passing a simulated clock makes it possible to
+# test the scheduling logic without waiting real time. 'sleep' is the
+# function used to wait, by default clock.sleep_ms(), but it can be
+# machine.lightsleep in order to save power between samples. 'busy', if
+# given, is a function returning True when the device is doing work
+# elsewhere (for instance in another thread): time slept while busy is
+# accounted as active, since the device was not really idle.
+class Scheduler:
+    def __init__(self,period,clock=time,sleep=None,busy=None):
+        self.period = period
+        self.clock = clock
+        self.sleep = sleep or clock.sleep_ms
+        self.busy = busy
+        self.awake_since = clock.ticks_ms()
+        self.deadline = clock.ticks_add(self.awake_since,period)
+        self.active_ms = 0
+        self.idle_ms = 0
+
+    # Sleep 'ms' milliseconds, accounting them as idle time, unless
+    # the device is busy elsewhere.
+    def idle(self,ms):
+        now = self.clock.ticks_ms()
+        self.active_ms += self.clock.ticks_diff(now,self.awake_since)
+        busy = self.busy and self.busy()
+        if ms > 0: self.sleep(ms)
+        self.awake_since = self.clock.ticks_ms()
+        slept = self.clock.ticks_diff(self.awake_since,now)
+        if busy:
+            self.active_ms += slept
+        else:
+            self.idle_ms += slept
+
+    # Sleep until the next sample is due. Deadlines are exactly 'period'
+    # apart, so the time spent reading the sensor and rendering does not
+    # make the sampling cadence drift. If we are so late that the deadline
+    # already passed, we return ASAP and the cadence restarts from now.
+    def wait(self):
+        left = self.clock.ticks_diff(self.deadline,self.clock.ticks_ms())
+        if left < 0:
+            self.idle(0)
+            self.deadline = self.clock.ticks_add(self.awake_since,self.period)
+            return
+        # Sleep may return early (for instance lightsleep can be woken
+        # up by other sources), so loop until the deadline is reached.
+        while left > 0:
+            self.idle(left)
+            left = self.clock.ticks_diff(self.deadline,self.clock.ticks_ms())
+        self.deadline = self.clock.ticks_add(self.deadline,self.period)
+
+    # Return a human readable report of active vs idle time.
+    def report(self):
+        total = self.active_ms+self.idle_ms
+        perc = self.active_ms*100/total if total else 0
+        return "active %d ms, idle %d ms (%.1f%% active)" % (self.active_ms,self.idle_ms,perc)
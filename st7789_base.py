@@ -50,6 +50,9 @@ ColorMode_16M = const(0x07)
 _ENCODE_PIXEL = ">H"
 _ENCODE_POS = ">HH"
 
+# Max number of colors we keep a pre-filled line buffer for.
+_LINEBUF_POOL_SIZE = const(8)
+
 class ST7789_base:
     def __init__(self, spi, width, height, reset, dc, cs=None, backlight=None,
                  xstart=None, ystart=None, inversion=False, fbmode=None):
@@ -96,12 +99,48 @@ class ST7789_base:
         self.charfb_data = bytearray(8*8*2)
         self.charfb = framebuf.FrameBuffer(self.charfb_data,8,8,framebuf.RGB565)
 
+        # Colors returned by color() are interned, so that the same
+        # color is always the same bytes object. For the most recently
+        # used colors we also keep a line buffer filled with that color:
+        # fills and lines just write a slice of it, without allocating
+        # and filling a new buffer at every call. When the pool is full,
+        # the least recently used color is evicted. Buffers are as long
+        # as the longest side of the display, but at least 256 pixels,
+        # so that small filled rectangles are sent with a single write.
+        self.colors = {}
+        self.linebufs = {}
+        self.linebufs_lru = [] # Pool colors, least recently used first.
+        self.linebuf_len = max(self.width,self.height,256)
+
     # That's the color format our API takes. We take r, g, b, translate
     # to 16 bit value and pack it as as two bytes.
     def color(self, r=0, g=0, b=0):
         # Convert red, green and blue values (0-255) into a 16-bit 565 encoding.
         c = (r & 0xf8) << 8 | (g & 0xfc) << 3 | b >> 3
-        return struct.pack(_ENCODE_PIXEL, c)
+        try:
+            return self.colors[c]
+        except KeyError:
+            color = struct.pack(_ENCODE_PIXEL, c)
+            self.colors[c] = color
+            return color
+
+    # Return 'n' pixels of the specified color, as a memoryview of
+    # the color line buffer. 'n' can't be larger than linebuf_len.
+    def color_pixels(self, color, n):
+        lru = self.linebufs_lru
+        buf = self.linebufs.get(color)
+        if buf is None:
+            if len(lru) >= _LINEBUF_POOL_SIZE:
+                del self.linebufs[lru.pop(0)]
+            buf = memoryview(color*self.linebuf_len)
+            self.linebufs[color] = buf
+            lru.append(color)
+        elif lru[-1] != color:
+            # Usually the same color is used many times in a row,
+            # in that case there is nothing to update.
+            lru.remove(color)
+            lru.append(color)
+        return buf[:max(n,0)*2] # Lines out of the screen have n <= 0.
 
     def write(self, command=None, data=None):
         """SPI write to the device: commands and data"""
@@ -214,7 +253,7 @@ class ST7789_base:
     # per loop dramatically improves performances.
     def fill(self,color):
         self.set_window(0, 0, self.width-1, self.height-1)
-        buf = color*self.width
+        buf = self.color_pixels(color,self.width)
         for i in range(self.height): self.write(None, buf)
 
     # Draw a full or empty rectangle.
@@ -222,13 +261,15 @@ class ST7789_base:
     # w and h are width/height in pixels.
     def rect(self,x,y,w,h,color,fill=False):
         if fill:
-            self.set_window(x,y,x+w-1,y+1-w)
-            if w*h > 256:
-                buf = color*w
+            self.set_window(x,y,x+w-1,y+h-1)
+            if w > self.linebuf_len:
+                buf = color*w # Rectangle larger than the display.
+                for i in range(h): self.write(None, buf)
+            elif w*h > self.linebuf_len:
+                buf = self.color_pixels(color,w)
                 for i in range(h): self.write(None, buf)
             else:
-                buf = color*(w*h)
-                self.write(None, buf)
+                self.write(None, self.color_pixels(color,w*h))
         else:
             self.hline(x,x+w-1,y,color)
             self.hline(x,x+w-1,y+h-1,color)
@@ -241,13 +282,13 @@ class ST7789_base:
         if y < 0 or y >= self.height: return
         x0,x1 = max(min(x0,x1),0),min(max(x0,x1),self.width-1)
         self.set_window(x0, y, x1, y)
-        self.write(None, color*(x1-x0+1))
+        self.write(None, self.color_pixels(color,x1-x0+1))
 
     # Same as hline() but for vertical lines.
     def vline(self,y0,y1,x,color):
         y0,y1 = max(min(y0,y1),0),min(max(y0,y1),self.height-1)
         self.set_window(x, y0, x, y1)
-        self.write(None, color*(y1-y0+1))
+        self.write(None, self.color_pixels(color,y1-y0+1))
 
     # Draw a single character 'char' using the font in the MicroPython
     # framebuffer implementation. It is possible to specify the background and
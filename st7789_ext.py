@@ -72,10 +72,66 @@ class ST7789(st7789_base.ST7789_base):
             return
         hdr = f.read(4)
         w,h = struct.unpack(">HH",hdr)
+        self.stream_image(x,y,w,h,f)
+        f.close()
+
+    # Show an image stored inside an ImageBundle (see below). No file
+    # is opened: we just seek to the image data in the bundle file.
+    def bundle_image(self,x,y,bundle,name):
+        try:
+            offset,w,h = bundle.index[name]
+        except KeyError:
+            print("Warning: image not found in bundle:", name)
+            return
+        bundle.f.seek(offset)
+        self.stream_image(x,y,w,h,bundle.f)
+
+    # Copy w*h RGB565 pixels from the file 'f' (already positioned at
+    # the start of the pixel data) to the display at x,y.
+    def stream_image(self,x,y,w,h,f):
         self.set_window(x,y,x+w-1,y+h-1)
+        left = w*h*2
         buf = bytearray(256)
         nocopy = memoryview(buf)
-        while True:
-            nread = f.readinto(buf)
-            if nread == 0: return
+        while left:
+            nread = f.readinto(nocopy[:min(left,256)])
+            if not nread: return
             self.write(None, nocopy[:nread])
+            left -= nread
+
+# A bundle packs many 565 images into a single file, with an index at
+# the start (see tools/mkbundle.py for the format). The file is kept
+# open, so showing an image is just a seek and a copy, without
+# directory scans or open/close calls for every image.
+class ImageBundle:
+    def __init__(self,filename):
+        self.f = open(filename,"rb")
+        try:
+            self.read_index(filename)
+        except:
+            self.f.close()
+            raise
+
+    # Read exactly 'n' bytes: a short read means the bundle is
+    # truncated or corrupted.
+    def read_exactly(self,n,filename):
+        data = self.f.read(n)
+        if len(data) != n:
+            raise ValueError("Truncated 565 bundle: "+filename)
+        return data
+
+    def read_index(self,filename):
+        magic,count = struct.unpack(">4sH",self.read_exactly(6,filename))
+        if magic != b"565B":
+            raise ValueError("Not a 565 bundle: "+filename)
+        self.index = {} # name -> (offset, width, height)
+        for i in range(count):
+            namelen = self.read_exactly(1,filename)[0]
+            name = self.read_exactly(namelen,filename).decode()
+            self.index[name] = struct.unpack(">IHH",self.read_exactly(8,filename))
+
+    def names(self):
+        return list(self.index)
+
+    def close(self):
+        self.f.close()
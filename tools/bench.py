@@ -0,0 +1,315 @@
+# Rendering benchmark. Draws a few canonical scenes using the real
+# driver and main.py code, but with fake SPI / Pin / sensor objects,
+# and reports for each scene:
+#
+#   ms          wall clock time (sleeps of the animations are skipped)
+#   spi_writes  number of SPI write transactions
+#   spi_bytes   number of bytes sent to the display
+#   spi_alloc_bytes / heap_alloc_bytes, see below
+#
+# Results are compared with the budgets in tools/bench_budgets.json, that
+# has a section for every Python implementation, and the program exits
+# with an error if any scene exceeded its budget. Run it from the
+# repository root, with CPython or the MicroPython unix port:
+#
+#   python3 tools/bench.py
+#   micropython -X heapsize=8M tools/bench.py
+#
+# Under MicroPython we report heap_alloc_bytes, the number of heap bytes
+# allocated, as reported by gc.mem_alloc() with the garbage collector
+# disabled. CPython has no way to count short lived allocations, so there
+# we report spi_alloc_bytes instead: the number of bytes sent to the
+# display from buffers allocated while drawing the scene (for instance
+# new color*n buffers). Other allocations, like lists, strings or
+# memoryview objects, are not counted: real heap usage is only checked
+# under MicroPython.
+#
+# Use --update to write the current results as the new budgets. SPI
+# counts are exact, allocations get a 5% headroom, and time some more
+# since it depends on the machine. Note that under CPython there is no
+# framebuf module, so a fake font is used, and numbers are not
+# comparable with the MicroPython ones.
+#
+# Copyright (C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# All Rights Reserved
+# This code is released under the MIT license.
+
+import sys, gc, json, random, struct
+import time as real_time
+
+BUDGETS_FILE = "tools/bench_budgets.json"
+CPYTHON = sys.implementation.name == "cpython"
+ALLOC = "spi_alloc_bytes" if CPYTHON else "heap_alloc_bytes"
+IMAGE_FILE = "pngs/bombjack1.565"
+
+def now_us():
+    if hasattr(real_time,"ticks_us"): return real_time.ticks_us()
+    return int(real_time.perf_counter()*1000000)
+
+def elapsed_us(start):
+    if hasattr(real_time,"ticks_diff"): return real_time.ticks_diff(now_us(),start)
+    return now_us()-start
+
+############################## FAKE HARDWARE ###################################
+
+# SPI bus that just counts what we send to the display. When
+# 'seen' is a dict, it also counts the bytes written from buffers
+# never written before, that is, newly allocated buffers.
+class FakeSPI:
+    def __init__(self,*args,**kwargs):
+        self.seen = None
+        self.reset()
+
+    def reset(self):
+        self.writes = 0
+        self.bytes = 0
+        self.alloc = 0
+
+    def write(self,data):
+        self.writes += 1
+        self.bytes += len(data)
+        if self.seen is not None:
+            # Slices of a long lived buffer don't allocate new data:
+            # what matters is the buffer the memoryview points to.
+            buf = data.obj if isinstance(data,memoryview) else data
+            if id(buf) not in self.seen:
+                self.seen[id(buf)] = buf # Keep it alive: ids can't be reused.
+                self.alloc += len(data)
+
+class FakePin:
+    OUT = 1
+    IN = 0
+    def __init__(self,*args,**kwargs): pass
+    def on(self): pass
+    def off(self): pass
+    def value(self,v=None): return 0
+
+class FakeDHT22:
+    def __init__(self,pin): pass
+    def measure(self): pass
+    def temperature(self): return 21.5
+    def humidity(self): return 45.0
+
+# The following classes replace the modules main.py and the driver
+# import. Classes are used instead of modules since MicroPython can't
+# create module objects at runtime.
+class fake_machine:
+    Pin = FakePin
+    SPI = FakeSPI
+    @staticmethod
+    def lightsleep(ms=None): pass
+
+class fake_dht:
+    DHT22 = FakeDHT22
+
+class fake_micropython:
+    @staticmethod
+    def const(x): return x
+
+# Real time, except that sleeping returns immediately: we want to
+# measure rendering, not the delays of the typing animation.
+class fake_time:
+    @staticmethod
+    def sleep(s): pass
+    @staticmethod
+    def sleep_ms(ms): pass
+    @staticmethod
+    def sleep_us(us): pass
+    @staticmethod
+    def ticks_ms(): return now_us()//1000
+    @staticmethod
+    def ticks_diff(a,b): return a-b
+    @staticmethod
+    def ticks_add(a,b): return a+b
+    @staticmethod
+    def time(): return now_us()//1000000
+
+# CPython has no framebuf module. This fake one draws a deterministic
+# pattern with roughly the density of the real 8x8 font.
+class fake_framebuf:
+    RGB565 = 1
+    MONO_HMSB = 2
+
+    class FrameBuffer:
+        def __init__(self,buf,width,height,fmt):
+            self.buf = buf
+            self.width = width
+            self.height = height
+            self.fmt = fmt
+
+        def fill(self,c):
+            if self.fmt == fake_framebuf.RGB565:
+                for i in range(self.width*self.height):
+                    self.buf[i*2] = c & 0xff
+                    self.buf[i*2+1] = c >> 8
+            else:
+                for i in range(len(self.buf)): self.buf[i] = 0xff if c else 0
+
+        def pixel(self,x,y,c):
+            if x < 0 or x >= self.width or y < 0 or y >= self.height: return
+            if self.fmt == fake_framebuf.RGB565:
+                i = (y*self.width+x)*2
+                self.buf[i] = c & 0xff
+                self.buf[i+1] = c >> 8
+            else:
+                self.buf[y*((self.width+7)//8)+x//8] |= 0x80 >> (x%8)
+
+        def text(self,s,x,y,c):
+            for i in range(len(s)):
+                seed = ord(s[i])
+                if seed == 32: continue # Space is blank.
+                for py in range(7):
+                    row = (seed*(py+7)*2654435761 >> 11) & (seed*(py+3)*40503 >> 5) & 0x7e
+                    for px in range(8):
+                        if row & (0x80 >> px): self.pixel(x+i*8+px,y+py,c)
+
+def install_fakes():
+    sys.modules["machine"] = fake_machine
+    sys.modules["dht"] = fake_dht
+    sys.modules["time"] = fake_time
+    try:
+        import micropython
+    except ImportError:
+        sys.modules["micropython"] = fake_micropython
+    try:
+        import ustruct
+    except ImportError:
+        sys.modules["ustruct"] = struct
+    try:
+        import framebuf
+    except ImportError:
+        sys.modules["framebuf"] = fake_framebuf
+
+#################################### SCENES ####################################
+
+def load_main():
+    install_fakes()
+    if "" not in sys.path: sys.path.insert(0,"")
+    import main
+    # Modules imported from now on should see the real time module.
+    sys.modules["time"] = real_time
+    main.bg_bundle = None
+    main.bg_images = [IMAGE_FILE]
+    return main
+
+# A full time series, one sample per display column, with some
+# variability so that the graph is not flat.
+def make_series(main,base):
+    return [base+((i*7)%23)/10+(i%5)/4 for i in range(main.display.width)]
+
+def get_scenes(main):
+    display = main.display
+    colors = main.c64colors
+    hourly = make_series(main,20)
+    daily = make_series(main,18)
+    return [
+        ("c64_screen", lambda:
+            main.c64_screen(show_banner=True,type_text=["LOAD *,8,1","RUN"])),
+        ("main_view_hourly", lambda:
+            main.main_view("80 minutes",21.5,45.0,hourly,main.graph_color1)),
+        ("main_view_daily", lambda:
+            main.main_view("daily",21.5,45.0,daily,main.graph_color2)),
+        ("shadowed_header", lambda:
+            main.big_centered_text(0,0,display.width,29,"21.5",
+                colors['white'],2,shadow=main.shadow_color)),
+        ("image", lambda: display.image(0,0,IMAGE_FILE)),
+        ("fill", lambda: display.fill(colors['blue'])),
+    ]
+
+def run_scene(spi,fn):
+    # Warm up run, so that caches are filled and the measure is
+    # not affected by first time allocations. Under CPython, all the
+    # buffers written here are long lived or already freed, and
+    # the ones written in the next run are considered new allocations.
+    if CPYTHON: spi.seen = {}
+    random.seed(1234)
+    fn()
+    if CPYTHON:
+        spi.reset()
+        random.seed(1234)
+        fn()
+        alloc = spi.alloc
+        spi.seen = None
+
+    spi.reset()
+    random.seed(1234)
+    gc.collect()
+    gc.disable()
+    if not CPYTHON: start_alloc = gc.mem_alloc()
+    start = now_us()
+    fn()
+    us = elapsed_us(start)
+    if not CPYTHON: alloc = gc.mem_alloc()-start_alloc
+    gc.enable()
+    return {"ms": us/1000, "spi_writes": spi.writes, "spi_bytes": spi.bytes,
+            ALLOC: alloc}
+
+################################### BUDGETS ####################################
+
+def load_budgets():
+    try:
+        with open(BUDGETS_FILE) as f: return json.load(f)
+    except OSError:
+        return {}
+
+def save_budgets(budgets):
+    try:
+        data = json.dumps(budgets,indent=4,sort_keys=True)
+    except TypeError:
+        data = json.dumps(budgets) # MicroPython json has no options.
+    with open(BUDGETS_FILE,"w") as f: f.write(data+"\n")
+
+# Budgets for the measured results. Time is not reproducible, so
+# we give it a large headroom. Allocations are reproducible with the
+# same interpreter version, but may change a bit across versions.
+def make_budget(res):
+    return {
+        "spi_writes": res["spi_writes"],
+        "spi_bytes": res["spi_bytes"],
+        ALLOC: int(res[ALLOC]*1.05),
+        "ms": int(res["ms"]*3)+10,
+    }
+
+def main():
+    update = "--update" in sys.argv
+    impl = sys.implementation.name
+    budgets = load_budgets()
+    mybudgets = budgets.get(impl,{})
+
+    m = load_main()
+    spi = m.display.spi
+    failed = []
+    results = {}
+    print("%-18s %10s %10s %10s %16s" % ("scene","ms","spi_writes","spi_bytes",ALLOC))
+    for name,fn in get_scenes(m):
+        res = run_scene(spi,fn)
+        results[name] = res
+        line = "%-18s %10.1f %10d %10d %16d" % (name,res["ms"],res["spi_writes"],res["spi_bytes"],res[ALLOC])
+        budget = mybudgets.get(name)
+        if update:
+            pass
+        elif not budget:
+            line += "  (no budget)"
+            if mybudgets: failed.append("%s: no budget" % name)
+        else:
+            over = [k for k in ("ms","spi_writes","spi_bytes",ALLOC) if res[k] > budget[k]]
+            for k in over:
+                failed.append("%s: %s is %s, budget is %s" % (name,k,res[k],budget[k]))
+            if over: line += "  OVER BUDGET: "+", ".join(over)
+        print(line)
+
+    if update:
+        budgets[impl] = dict((name,make_budget(res)) for name,res in results.items())
+        save_budgets(budgets)
+        print("Budgets for %s written to %s" % (impl,BUDGETS_FILE))
+        return
+    if not mybudgets:
+        print("No budgets for %s in %s: run with --update to create them." % (impl,BUDGETS_FILE))
+        sys.exit(1)
+    if failed:
+        print("\nPerformance regressions:")
+        for f in failed: print("  "+f)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
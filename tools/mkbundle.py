@@ -0,0 +1,60 @@
+# Pack many .565 images into a single bundle file, to be used with
+# the ImageBundle class of st7789_ext. This runs on the host, not on
+# the device:
+#
+#   python3 tools/mkbundle.py images.bundle pngs/*.565
+#
+# Bundle format (all integers are big endian, like in .565 files):
+#
+#   "565B"                      4 bytes magic
+#   count                       16 bit, number of images
+#   count times:
+#       namelen                 8 bit
+#       name                    namelen bytes, the file name without .565
+#       offset                  32 bit, where pixel data starts in the file
+#       width, height           16 bit each
+#   pixel data                  raw RGB565, one image after the other
+#
+# Copyright (C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# All Rights Reserved
+# This code is released under the MIT license.
+
+import os, struct, sys
+
+def load_565(filename):
+    with open(filename,"rb") as f:
+        w,h = struct.unpack(">HH",f.read(4))
+        data = f.read()
+    if len(data) != w*h*2:
+        raise ValueError(f"{filename}: expected {w*h*2} bytes of pixel data, got {len(data)}")
+    return w,h,data
+
+def build_bundle(output,inputs):
+    images = []
+    for filename in inputs:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        if len(name.encode()) > 255:
+            raise ValueError(f"{filename}: name too long")
+        images.append((name,)+load_565(filename))
+
+    # Compute the index size first, so that we know where the pixel
+    # data of each image will start.
+    offset = 6
+    for name,w,h,data in images: offset += 1+len(name.encode())+8
+
+    with open(output,"wb") as f:
+        f.write(struct.pack(">4sH",b"565B",len(images)))
+        for name,w,h,data in images:
+            name = name.encode()
+            f.write(bytes([len(name)])+name)
+            f.write(struct.pack(">IHH",offset,w,h))
+            offset += len(data)
+        for name,w,h,data in images: f.write(data)
+    return len(images)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(f"Usage: {sys.argv[0]} output.bundle image1.565 image2.565 ...")
+        sys.exit(1)
+    count = build_bundle(sys.argv[1],sys.argv[2:])
+    print(f"{count} images written to {sys.argv[1]}")